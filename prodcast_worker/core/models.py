@@ -1,8 +1,15 @@
-from django.db import models
+import datetime
+import io
+
+from django.db import connections, models, router
 from django.contrib.auth.models import User
-from django.db.models.signals import pre_save
-from django.dispatch import receiver
+from django.contrib.postgres.indexes import BrinIndex
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from fast_update.query import FastUpdateManager
 
 # --- New Unit System Models ---
 
@@ -58,8 +65,8 @@ class UnitDefinition(models.Model):
     unit_definition_id = models.AutoField(primary_key=True)
     unit_definition_name = models.CharField("Unit Definition Name", max_length=100)
     unit_type = models.ForeignKey(UnitType, on_delete=models.PROTECT, verbose_name="Unit Type") # PROTECT to prevent deletion of UnitType if definitions exist
-    scale_factor = models.DecimalField("Scale Factor", max_digits=20, decimal_places=10) # Adjust max_digits/decimal_places as needed
-    offset = models.DecimalField("Offset", max_digits=20, decimal_places=10)
+    scale_factor = models.FloatField("Scale Factor") # float, not Decimal: used in unit conversion arithmetic
+    offset = models.FloatField("Offset")
     is_base = models.BooleanField("Is Base Unit", default=False)
     alias_text = models.CharField("Alias Text", max_length=50, blank=True, null=True)
     precision = models.IntegerField("Precision")
@@ -78,8 +85,15 @@ class UnitDefinition(models.Model):
         verbose_name_plural = "Unit Definitions"
         unique_together = (("unit_definition_name", "unit_type"),) # Name might not be unique globally, but unique within a type
         ordering = ["unit_definition_name"]
+        indexes = [
+            models.Index(fields=["unit_type", "is_base"]), # base unit lookup in ObjectTypeProperty.save
+        ]
 
 
+class UnitCategoryManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().select_related("unit_type") # used by __str__
+
 class UnitCategory(models.Model):
     """
     Categorizes units (e.g., Angle, Anisotropy).
@@ -93,6 +107,8 @@ class UnitCategory(models.Model):
     created_by = models.IntegerField(null=True, blank=True)
     modified_by = models.IntegerField(null=True, blank=True)
 
+    objects = UnitCategoryManager()
+
     def __str__(self):
         return f"{self.unit_category_name} ({self.unit_type.unit_type_name})"
 
@@ -104,6 +120,10 @@ class UnitCategory(models.Model):
         ordering = ["unit_category_name"]
 
 
+class UnitSystemCategoryDefinitionManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().select_related("unit_system", "unit_category", "unit_definition") # used by __str__
+
 class UnitSystemCategoryDefinition(models.Model):
     """
     Links a Unit System, Unit Category, and a specific Unit Definition.
@@ -118,6 +138,8 @@ class UnitSystemCategoryDefinition(models.Model):
     created_by = models.IntegerField(null=True, blank=True)
     modified_by = models.IntegerField(null=True, blank=True)
 
+    objects = UnitSystemCategoryDefinitionManager()
+
     def __str__(self):
         return f"{self.unit_system.unit_system_name} - {self.unit_category.unit_category_name} uses {self.unit_definition.unit_definition_name}"
 
@@ -129,6 +151,28 @@ class UnitSystemCategoryDefinition(models.Model):
         ordering = ["unit_system", "unit_category"]
 
 
+# Справочные значения кэшируются в django cache на REFERENCE_CACHE_TIMEOUT секунд:
+# правки, сделанные через API (сигналы этого процесса их не видят), подхватываются
+# без перезапуска воркера.
+REFERENCE_CACHE_TIMEOUT = 60
+
+
+def get_base_unit_id(unit_type_id):
+    # unit_type_id -> base unit_definition_id. "Нет базовой единицы" не кэшируется:
+    # ObjectTypeProperty.save сохраняет результат, и закэшированный None записал бы
+    # unit=None даже после появления базовой единицы
+    key = f"base_unit:{unit_type_id}"
+    base_unit_id = cache.get(key)
+    if base_unit_id is None:
+        base_unit_id = UnitDefinition.objects.filter(
+            unit_type_id=unit_type_id,
+            is_base=True
+        ).values_list("pk", flat=True).first()
+        if base_unit_id is not None:
+            cache.set(key, base_unit_id, REFERENCE_CACHE_TIMEOUT)
+    return base_unit_id
+
+
 # ---------- Data Source ----------
 class DataSource(models.Model):
     data_source_name = models.CharField("Data Source", max_length=50, unique=True)
@@ -153,8 +197,17 @@ class ScenarioComponent(models.Model):
     last_updated = models.DateTimeField(null=True, blank=True)
     file = models.FileField(upload_to='models_files/', null=True, blank=True)
 
+    _loaded_data_source_id = None  # data_source_id из БД, см. sync_link_data_source
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_data_source_id = instance.__dict__.get("data_source_id")
+        return instance
+
     def __str__(self):
-        return f"{self.name} ({self.data_source})"
+        # only local columns: printing lists of components must not load DataSource per row
+        return f"{self.name} ({self.data_source_id})"
 
     class Meta:
         db_table = 'apiapp_scenario_component'
@@ -168,6 +221,14 @@ class ActiveManager(models.Manager):
     def get_queryset(self):
         return super().get_queryset().filter(is_active=True)
 
+    def with_user(self):
+        # for pages that render created_by: one JOIN instead of a query per server
+        return self.get_queryset().select_related("created_by")
+
+    def lean(self):
+        # health checks / metrics: only the columns needed to reach the server
+        return self.get_queryset().only("server_id", "server_name", "server_url", "server_status")
+
 class ServersClass(models.Model):
     server_id = models.AutoField(primary_key=True)
     server_name = models.CharField(max_length=50, unique=True)
@@ -186,12 +247,13 @@ class ServersClass(models.Model):
         return self.server_name
 
     def deactivate(self):
+        type(self).all_objects.filter(pk=self.pk).update(is_active=False)
         self.is_active = False
-        self.save()
 
     def activate(self):
+        # all_objects: the default manager hides inactive servers
+        type(self).all_objects.filter(pk=self.pk).update(is_active=True)
         self.is_active = True
-        self.save()
 
     class Meta:
         db_table = 'apiapp_servers'
@@ -227,49 +289,93 @@ class ScenarioClass(models.Model):
         verbose_name_plural = "Scenarios" # Corrected from verbose_plural
         ordering = ["-created_date"]
 
-from django.utils import timezone
+# ---------- Bulk ingest ----------
+def _copy_text(value):
+    # text form of a prepared DB value for COPY ... (FORMAT csv)
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return str(value)
+
+
+class BulkIngestManager(FastUpdateManager):
+    """
+    fast_update()/copy_update() from django-fast-update for large updates,
+    plus copy_insert() for large inserts.
+    """
+
+    def copy_insert(self, objs, fields):
+        """
+        Insert objs via PostgreSQL COPY ... FROM STDIN instead of INSERT.
+        For large ingest batches (10k+ rows); like bulk_create it sends no signals,
+        and it does not set pks on objs.
+        """
+        # Manager.db goes through db_for_read; COPY is a write
+        connection = connections[self._db or router.db_for_write(self.model, **self._hints)]
+        model_fields = [self.model._meta.get_field(name) for name in fields]
+
+        # CSV: NULL is an unquoted empty field, every other value is quoted,
+        # so '' and a literal \N stay text
+        buffer = io.StringIO()
+        for obj in objs:
+            row = []
+            for field in model_fields:
+                value = field.get_db_prep_save(field.pre_save(obj, True), connection)
+                row.append("" if value is None else '"%s"' % _copy_text(value).replace('"', '""'))
+            buffer.write(",".join(row) + "\n")
+        buffer.seek(0)
+
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        columns = ", ".join(connection.ops.quote_name(field.column) for field in model_fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+
 
 class ScenarioLog(models.Model):
     scenario = models.ForeignKey("ScenarioClass", on_delete=models.CASCADE, related_name="logs")
     timestamp = models.DateTimeField(default=timezone.now)
     message = models.TextField()
     progress = models.IntegerField(default=0)  # % прогресса
+
+    objects = BulkIngestManager()
     
     class Meta:
         db_table = 'apiapp_scenariolog'
         verbose_name = "ScenarioLog"
         verbose_name_plural = "ScenarioLogs"
+        indexes = [
+            models.Index(fields=["scenario", "-timestamp"], name="scenlog_sc_ts_idx"),
+        ]
 
 # ---------- Scenario ↔ Component Link ----------
 class ScenarioComponentLink(models.Model):
     scenario = models.ForeignKey('ScenarioClass', on_delete=models.CASCADE, verbose_name="Scenario")
     component = models.ForeignKey('ScenarioComponent', on_delete=models.CASCADE, verbose_name="Component")
+    data_source = models.ForeignKey(DataSource, on_delete=models.PROTECT, verbose_name="Data Source", editable=False)  # auto-set из component
+
+    _loaded_component_id = None  # component_id из БД, см. set_link_data_source
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_component_id = instance.__dict__.get("component_id")
+        return instance
 
     class Meta:
         db_table = 'apiapp_scenario_component_link'
         unique_together = (("scenario", "component"),)  # ← защита от точных дублей
+        constraints = [
+            # один компонент на data_source в сценарии; проверяет БД, без SELECT на каждый save
+            models.UniqueConstraint(fields=["scenario", "data_source"], name="uniq_scenario_ds"),
+        ]
         verbose_name = "Scenario Component Link"
         verbose_name_plural = "Scenario Component Links"
 
     def __str__(self):
-        return f"{self.scenario} ↔ {self.component} ({self.component.data_source})"
-
-    def clean(self):
-        # Проверка: есть ли уже другой компонент с этим data_source в этом сценарии
-        exists = ScenarioComponentLink.objects.filter(
-            scenario=self.scenario,
-            component__data_source=self.component.data_source
-        ).exclude(pk=self.pk).exists()
-
-        if exists:
-            raise ValidationError(
-                f"A component with data source '{self.component.data_source}' "
-                f"already exists for scenario '{self.scenario}'."
-            )
-
-    def save(self, *args, **kwargs):
-        self.full_clean()  # запускаем clean() при сохранении
-        super().save(*args, **kwargs)
+        # ids only (data_source is denormalized on the link), so no lazy FK loads;
+        # for names use select_related("scenario", "component", "data_source")
+        return f"{self.scenario_id} ↔ {self.component_id} ({self.data_source_id})"
 
 
 # ---------- Object Models ----------
@@ -299,6 +405,10 @@ class ObjectInstance(models.Model):
         db_table = 'apiapp_object_instance'
         verbose_name = "Object Instance"
         verbose_name_plural = "Object Instances"
+        constraints = [
+            # target of the composite FK mc_oi_ot_fk on apiapp_mainclass
+            models.UniqueConstraint(fields=["object_type", "object_instance_id"], name="oi_ot_oi_uniq"),
+        ]
         ordering = ["object_instance_name"] # Changed to name for better ordering
 
 
@@ -314,15 +424,11 @@ class ObjectTypeProperty(models.Model):
     unit = models.ForeignKey(UnitDefinition, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Unit", editable=False)  # auto-set
 
     def save(self, *args, **kwargs):
-        if self.unit_category:
-            # find the base unit for this category
-            base_unit = UnitDefinition.objects.filter(
-                unit_type=self.unit_category.unit_type,
-                is_base=True
-            ).first()
-            self.unit = base_unit
+        if self.unit_category_id is not None:
+            # find the base unit for this category (cached, no FK load)
+            self.unit_id = get_base_unit_id(get_unit_category_type_id(self.unit_category_id))
         else:
-            self.unit = None
+            self.unit_id = None
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -344,35 +450,176 @@ class MainClass(models.Model):
     object_instance = models.ForeignKey(ObjectInstance, on_delete=models.CASCADE, verbose_name="Object Instance")
     object_type_property = models.ForeignKey(ObjectTypeProperty, on_delete=models.CASCADE, verbose_name="Object Type Property")
 
-    value = models.DecimalField(max_digits=38, decimal_places=28, db_column='value', null=True)
+    value = models.FloatField(db_column='value', null=True) # double precision; NUMERIC(38,28) was overkill for measured values
     date_time = models.DateTimeField("Date", db_column='date', null=True) # Changed to DateTimeField
     sub_data_source = models.CharField("Category", max_length=50, null=True)
     description = models.TextField("Description", null=True, blank=True)
 
+    objects = BulkIngestManager()
+
+    # columns read by to_dict/row_to_dict; description and sub_data_source are skipped
+    DICT_VALUES = (
+        "data_source_id",
+        "object_instance_id",
+        "date_time",
+        "object_type_id",
+        "object_type_property_id",
+        "data_source_name__data_source_name",
+    )
+
     def to_dict(self):
-        return {
+        return self.row_to_dict({
             "data_source_id": self.data_source_id,
             "object_instance_id": self.object_instance_id,
-            "date_time": self.date_time.isoformat() if self.date_time else None, # Format datetime for dict
+            "date_time": self.date_time,
             "object_type_id": self.object_type_id,
             "object_type_property_id": self.object_type_property_id,
-            "data_source_name": str(self.data_source_name)
+            "data_source_name__data_source_name": get_data_source_name(self.data_source_name_id)
+        })
+
+    @staticmethod
+    def row_to_dict(row):
+        # row is a dict from .values(*MainClass.DICT_VALUES)
+        return {
+            "data_source_id": row["data_source_id"],
+            "object_instance_id": row["object_instance_id"],
+            "date_time": row["date_time"].isoformat() if row["date_time"] else None, # Format datetime for dict
+            "object_type_id": row["object_type_id"],
+            "object_type_property_id": row["object_type_property_id"],
+            "data_source_name": row["data_source_name__data_source_name"]
         }
 
+    @classmethod
+    def slim_qs(cls):
+        # model instances without the wide text columns
+        return cls.objects.only(
+            "data_source_name", "data_source_id", "date_time", "value",
+            "object_instance", "object_type", "object_type_property"
+        )
+
+    @classmethod
+    def dict_qs(cls, queryset=None):
+        # plain dicts for row_to_dict: no model instantiation, DataSource name via JOIN
+        queryset = cls.objects.all() if queryset is None else queryset
+        return queryset.values(*cls.DICT_VALUES)
+
+    @classmethod
+    def stream(cls, queryset=None, chunk_size=2000):
+        # to_dict-shaped rows for bulk exports. On PostgreSQL .iterator() reads through
+        # a server-side cursor, so memory stays at O(chunk_size) instead of O(N).
+        # Without a queryset Meta.ordering is dropped: no index serves it, and a full
+        # sort would delay the first row until the whole table is read
+        if queryset is None:
+            queryset = cls.objects.order_by()
+        for row in cls.dict_qs(queryset).iterator(chunk_size=chunk_size):
+            yield cls.row_to_dict(row)
+
+    # object_instance must belong to object_type: checked by validate_object_instance.
+    # Django has no composite FKs; once the API schema has
+    #   ALTER TABLE apiapp_mainclass ADD CONSTRAINT mc_oi_ot_fk
+    #     FOREIGN KEY (object_type_id, object_instance_id)
+    #     REFERENCES apiapp_object_instance (object_type_id, object_instance_id);
+    # the receiver can be dropped in the same change.
     class Meta:
         db_table = "apiapp_mainclass"
         verbose_name = "Main Data Record"
         verbose_name_plural = "Main Data Records"
         ordering = ["-data_source_id", "data_source_name"]
         indexes = [
-            models.Index(fields=["data_source_name", "data_source_id"]),
+            # filter by data source, newest data_source_id first; INCLUDE allows index-only scans
+            models.Index(
+                fields=["data_source_name", "-data_source_id"],
+                name="mc_ds_dsid_idx",
+                include=["value", "date_time"],
+            ),
+            models.Index(fields=["object_instance", "date_time"], name="mc_oi_date_idx"),
+            # date ranges on an append-mostly table: tiny index, cheap to maintain
+            BrinIndex(fields=["date_time"], name="mc_date_brin", pages_per_range=32),
             models.Index(fields=["object_type", "object_type_property"]),
         ]
 
 
-# ---------- Validation ----------
+# ---------- Reference data cache ----------
+# Справочники почти не меняются: нужные значения по pk берём из django cache
+# (REFERENCE_CACHE_TIMEOUT). Кэшируются значения, а не экземпляры моделей, чтобы
+# вызывающие не делили один изменяемый объект. Локальные save/delete сбрасывают
+# ключ сразу, правки через API подхватываются по истечении таймаута.
+def get_data_source_name(pk):
+    return cache.get_or_set(
+        f"data_source_name:{pk}",
+        lambda: DataSource.objects.values_list("data_source_name", flat=True).get(pk=pk),
+        REFERENCE_CACHE_TIMEOUT
+    )
+
+
+def get_unit_category_type_id(pk):
+    return cache.get_or_set(
+        f"unit_category_type:{pk}",
+        lambda: UnitCategory.objects.values_list("unit_type_id", flat=True).get(pk=pk),
+        REFERENCE_CACHE_TIMEOUT
+    )
+
+
+def get_object_instance_type_id(pk):
+    return cache.get_or_set(
+        f"object_instance_type:{pk}",
+        lambda: ObjectInstance.objects.values_list("object_type_id", flat=True).get(pk=pk),
+        REFERENCE_CACHE_TIMEOUT
+    )
+
+
+# ---------- Signals ----------
 @receiver(pre_save, sender=MainClass)
 def validate_object_instance(sender, instance, **kwargs):
-    if instance.object_instance.object_type != instance.object_type:
+    # сравниваем id по кэшу, без загрузки ObjectInstance на каждый save
+    if get_object_instance_type_id(instance.object_instance_id) != instance.object_type_id:
         raise ValidationError("Object instance must belong to the selected object type.")
 
+
+@receiver(pre_save, sender=ScenarioComponentLink)
+def set_link_data_source(sender, instance, **kwargs):
+    # Денормализуем data_source компонента для UniqueConstraint uniq_scenario_ds.
+    # bulk_create сигналы не вызывает — там data_source нужно задавать явно.
+    # Компонент читается только для новой связи или при смене component.
+    if instance.component_id is None:
+        return
+    if instance.data_source_id is not None and instance.component_id == instance._loaded_component_id:
+        return
+    instance.data_source_id = instance.component.data_source_id
+
+
+@receiver(post_save, sender=ScenarioComponentLink)
+def remember_link_component(sender, instance, **kwargs):
+    instance._loaded_component_id = instance.component_id
+
+
+@receiver(post_save, sender=ScenarioComponent)
+def sync_link_data_source(sender, instance, created, update_fields=None, **kwargs):
+    # Смена data_source у компонента переносится в его связи, чтобы uniq_scenario_ds
+    # проверял актуальную пару: конфликт в сценарии даст IntegrityError.
+    # UPDATE только если data_source действительно изменился
+    if update_fields is not None and "data_source" not in update_fields:
+        return
+    if not created and instance.data_source_id != instance._loaded_data_source_id:
+        ScenarioComponentLink.objects.filter(component=instance).update(data_source_id=instance.data_source_id)
+    instance._loaded_data_source_id = instance.data_source_id
+
+
+@receiver([post_save, post_delete], sender=UnitDefinition)
+def reset_base_unit_cache(sender, instance, **kwargs):
+    cache.delete(f"base_unit:{instance.unit_type_id}")
+
+
+@receiver([post_save, post_delete], sender=DataSource)
+def reset_data_source_cache(sender, instance, **kwargs):
+    cache.delete(f"data_source_name:{instance.pk}")
+
+
+@receiver([post_save, post_delete], sender=UnitCategory)
+def reset_unit_category_cache(sender, instance, **kwargs):
+    cache.delete(f"unit_category_type:{instance.pk}")
+
+
+@receiver([post_save, post_delete], sender=ObjectInstance)
+def reset_object_instance_cache(sender, instance, **kwargs):
+    cache.delete(f"object_instance_type:{instance.pk}")
@@ -1,45 +1,84 @@
 from celery import shared_task
 from .models import ScenarioClass, ScenarioLog
-import time
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
 server_name = "Server 1"
 
+# Пауза между шагами прогресса (сек). Вместо time.sleep шаги планируются через countdown,
+# чтобы слот воркера не простаивал между ними.
+PROGRESS_INTERVAL = 5
+
+
+def _log(scenario_id, message, progress):
+    # строка лога уходит в очередь logs (CELERY_TASK_ROUTES) сразу, сценарий её не ждёт;
+    # если цепочка оборвётся, уже записанные шаги останутся в ScenarioLog
+    log_batch.delay([{
+        "scenario_id": scenario_id,
+        "timestamp": timezone.now().isoformat(),
+        "message": message,
+        "progress": progress
+    }])
+
+
 @shared_task(name="worker.run_scenario", bind=True)
 def run_scenario(self, scenario_id: int, start_date: str, end_date: str):
-    # self здесь нужен только если bind=True (для update_state)
-    scenario = ScenarioClass.objects.get(scenario_id=scenario_id)
-    scenario.status = "STARTED"
-    scenario.start_date = timezone.now()
-    scenario.save()
-
-    ScenarioLog.objects.create(
-        scenario=scenario,
-        message="Task started",
-        progress=0
+    # self здесь нужен только если bind=True (для replace/update_state)
+    updated = ScenarioClass.objects.filter(pk=scenario_id).update(
+        status="STARTED",
+        start_date=timezone.now()
+    )
+    if not updated:
+        raise ScenarioClass.DoesNotExist(f"Scenario {scenario_id} does not exist.")
+
+    _log(scenario_id, "Task started", 0)
+
+    # replace() сохраняет task_id, поэтому прогресс и итоговый результат
+    # видны по id исходной задачи run_scenario
+    return self.replace(
+        tick_scenario.si(scenario_id, start_date, end_date, 0).set(countdown=PROGRESS_INTERVAL)
+    )
+
+
+@shared_task(name="worker.tick_scenario", bind=True)
+def tick_scenario(self, scenario_id: int, start_date: str, end_date: str, progress: int):
+    # Симуляция прогресса
+    _log(scenario_id, f"Progress: {progress}%", progress)
+    self.update_state(state="STARTED", meta={"progress": progress})
+
+    if progress >= 100:
+        return self.replace(finish_scenario.si(scenario_id, start_date, end_date))
+    return self.replace(
+        tick_scenario.si(scenario_id, start_date, end_date, progress + 10).set(countdown=PROGRESS_INTERVAL)
     )
 
-    for i in range(0, 101, 10):
-        # Симуляция прогресса
-        time.sleep(5)
-        ScenarioLog.objects.create(
-            scenario=scenario,
-            timestamp=timezone.now(),
-            message=f"Progress: {i}%",
-            progress=i
-        )
-        self.update_state(state="STARTED", meta={"progress": i})
-
-    scenario.status = "SUCCESS"
-    scenario.end_date = timezone.now()
-    scenario.description = f"Calculated from {start_date} to {end_date}"
-    scenario.save()
-
-    ScenarioLog.objects.create(
-        scenario=scenario,
-        timestamp=timezone.now(),
-        message="Task finished",
-        progress=100
+
+@shared_task(name="worker.finish_scenario")
+def finish_scenario(scenario_id: int, start_date: str, end_date: str):
+    ScenarioClass.objects.filter(pk=scenario_id).update(
+        status="SUCCESS",
+        end_date=timezone.now(),
+        description=f"Calculated from {start_date} to {end_date}"
     )
 
+    _log(scenario_id, "Task finished", 100)
+
     return {"status": "SUCCESS", "scenario_id": scenario_id}
+
+
+# acks_late=False: у ScenarioLog нет уникального ключа, повторная доставка после
+# падения воркера между INSERT и ack задублировала бы строки
+@shared_task(name="worker.log_batch", acks_late=False)
+def log_batch(rows: list):
+    ScenarioLog.objects.bulk_create(
+        [
+            ScenarioLog(
+                scenario_id=row["scenario_id"],
+                timestamp=parse_datetime(row["timestamp"]),
+                message=row["message"],
+                progress=row["progress"]
+            )
+            for row in rows
+        ],
+        batch_size=1000
+    )
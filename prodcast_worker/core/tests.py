@@ -1,3 +1,247 @@
+import datetime
+from unittest import mock
+
+from celery.backends.cache import CacheBackend
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.utils import timezone
+
+from prodcast_worker.celery import app as celery_app
+from .models import (
+    DataSource, MainClass, ObjectInstance, ObjectType, ObjectTypeProperty, ScenarioClass, ScenarioComponent,
+    ScenarioComponentLink, ScenarioLog, UnitCategory, UnitDefinition, UnitType,
+)
+from .tasks import run_scenario
+
+
+class RunScenarioTests(TestCase):
+    def setUp(self):
+        # Celery conf is already loaded from settings, so eager mode is switched on
+        # the app itself; results go to an in-memory backend instead of Redis
+        self._conf = {
+            key: celery_app.conf[key]
+            for key in ("task_always_eager", "task_eager_propagates", "task_store_eager_result")
+        }
+        celery_app.conf.update(
+            task_always_eager=True,
+            task_eager_propagates=True,
+            task_store_eager_result=True,  # store update_state progress in the backend
+        )
+        self.backend = CacheBackend(app=celery_app, backend="memory")
+        backend_patcher = mock.patch.object(type(celery_app), "backend", new_callable=mock.PropertyMock,
+                                            return_value=self.backend)
+        backend_patcher.start()
+        self.addCleanup(backend_patcher.stop)
+        self.scenario = ScenarioClass.objects.create(scenario_name="Scenario 1", status="PENDING")
+
+    def tearDown(self):
+        celery_app.conf.update(self._conf)
+
+    def test_run_scenario_chain(self):
+        with mock.patch.object(self.backend, "store_result", wraps=self.backend.store_result) as store:
+            result = run_scenario.apply(args=(self.scenario.scenario_id, "2025-01-01", "2025-02-01"))
+
+        expected = {"status": "SUCCESS", "scenario_id": self.scenario.scenario_id}
+        self.assertEqual(result.get(), expected)
+
+        # every step reports progress under the original run_scenario task id
+        task_ids = {call.args[0] for call in store.call_args_list}
+        self.assertEqual(task_ids, {result.id})
+        progress = [call.args[1]["progress"] for call in store.call_args_list if call.args[2] == "STARTED"]
+        self.assertEqual(progress, list(range(0, 101, 10)))
+
+        self.scenario.refresh_from_db()
+        self.assertEqual(self.scenario.status, "SUCCESS")
+        self.assertIsNotNone(self.scenario.start_date)
+        self.assertIsNotNone(self.scenario.end_date)
+        self.assertEqual(self.scenario.description, "Calculated from 2025-01-01 to 2025-02-01")
+
+        logs = list(ScenarioLog.objects.filter(scenario=self.scenario).order_by("timestamp", "pk"))
+        self.assertEqual(len(logs), 13)
+        self.assertEqual(
+            [(log.message, log.progress) for log in logs],
+            [("Task started", 0)]
+            + [(f"Progress: {i}%", i) for i in range(0, 101, 10)]
+            + [("Task finished", 100)],
+        )
+
+    def test_logs_written_before_failed_step_are_kept(self):
+        store_result = self.backend.store_result
+
+        def fail_at_50(task_id, result, state, *args, **kwargs):
+            if state == "STARTED" and result["progress"] == 50:
+                raise RuntimeError("broker lost")
+            return store_result(task_id, result, state, *args, **kwargs)
+
+        with mock.patch.object(self.backend, "store_result", side_effect=fail_at_50):
+            with self.assertRaises(RuntimeError):
+                run_scenario.apply(args=(self.scenario.scenario_id, "2025-01-01", "2025-02-01"))
+
+        self.assertEqual(
+            list(ScenarioLog.objects.filter(scenario=self.scenario).order_by("timestamp", "pk")
+                 .values_list("message", flat=True)),
+            ["Task started"] + [f"Progress: {i}%" for i in range(0, 51, 10)],
+        )
+
+
+class CopyInsertTests(TestCase):
+    def setUp(self):
+        self.data_source = DataSource.objects.create(data_source_name="Source")
+        self.object_type = ObjectType.objects.create(object_type_name="Well")
+        self.object_instance = ObjectInstance.objects.create(object_type=self.object_type, object_instance_name="W-1")
+        self.object_type_property = ObjectTypeProperty.objects.create(
+            object_type=self.object_type,
+            object_type_property_name="Rate",
+            object_type_property_category="Production",
+        )
+
+    def _record(self, **kwargs):
+        return MainClass(
+            data_source_name=self.data_source,
+            data_source_id=1,
+            object_type=self.object_type,
+            object_instance=self.object_instance,
+            object_type_property=self.object_type_property,
+            **kwargs
+        )
+
+    def test_copy_insert_main_class(self):
+        date_time = datetime.datetime(2025, 1, 31, 12, 30, tzinfo=datetime.timezone.utc)
+        MainClass.objects.copy_insert(
+            [
+                self._record(value=1.5, date_time=date_time, sub_data_source='a,"b"', description="\\N"),
+                self._record(value=None, date_time=None, sub_data_source="", description=None),
+            ],
+            fields=[
+                "data_source_name", "data_source_id", "object_type", "object_instance",
+                "object_type_property", "value", "date_time", "sub_data_source", "description",
+            ],
+        )
+
+        rows = list(
+            MainClass.objects.order_by("pk").values_list("value", "date_time", "sub_data_source", "description")
+        )
+        self.assertEqual(rows, [
+            (1.5, date_time, 'a,"b"', "\\N"),
+            (None, None, "", None),
+        ])
+
+    def test_copy_insert_scenario_log(self):
+        scenario = ScenarioClass.objects.create(scenario_name="Scenario 1", status="PENDING")
+        ScenarioLog.objects.copy_insert(
+            [ScenarioLog(scenario=scenario, message="Task started")],
+            fields=["scenario", "timestamp", "message", "progress"],
+        )
+
+        log = ScenarioLog.objects.get()
+        self.assertEqual((log.scenario_id, log.message, log.progress), (scenario.scenario_id, "Task started", 0))
+        self.assertIsNotNone(log.timestamp)
+
+
+class ObjectTypePropertyUnitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.unit_type = UnitType.objects.create(unit_type_name="Rate")
+        self.unit_category = UnitCategory.objects.create(unit_type=self.unit_type, unit_category_name="Liquid Rate")
+        self.property = ObjectTypeProperty(
+            object_type=ObjectType.objects.create(object_type_name="Well"),
+            object_type_property_name="Rate",
+            object_type_property_category="Production",
+            unit_category=self.unit_category,
+        )
+
+    def _base_unit(self, **kwargs):
+        return UnitDefinition(
+            unit_definition_name="m3/d", unit_type=self.unit_type, scale_factor=1, offset=0,
+            is_base=True, precision=2, **kwargs
+        )
+
+    def test_save_sets_base_unit(self):
+        base_unit = self._base_unit()
+        base_unit.save()
+        self.property.save()
+        self.assertEqual(self.property.unit_id, base_unit.pk)
+
+    def test_missing_base_unit_is_not_cached(self):
+        self.property.save()
+        self.assertIsNone(self.property.unit_id)
+
+        # bulk_create sends no signals, as with a base unit added by another process
+        base_unit, = UnitDefinition.objects.bulk_create([self._base_unit()])
+        self.property.save()
+        self.assertEqual(self.property.unit_id, base_unit.pk)
+
+
+class MainClassValidationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.well = ObjectType.objects.create(object_type_name="Well")
+        self.pipe = ObjectType.objects.create(object_type_name="Pipe")
+        self.record = MainClass(
+            data_source_name=DataSource.objects.create(data_source_name="Source"),
+            data_source_id=1,
+            object_type=self.well,
+            object_instance=ObjectInstance.objects.create(object_type=self.well, object_instance_name="W-1"),
+            object_type_property=ObjectTypeProperty.objects.create(
+                object_type=self.well,
+                object_type_property_name="Rate",
+                object_type_property_category="Production",
+            ),
+        )
+
+    def test_save_with_matching_object_type(self):
+        self.record.save()
+        self.assertEqual(MainClass.objects.count(), 1)
+
+    def test_save_rejects_object_instance_of_other_type(self):
+        self.record.object_type = self.pipe
+        with self.assertRaises(ValidationError):
+            self.record.save()
+        self.assertFalse(MainClass.objects.exists())
+
+
+class ScenarioComponentLinkTests(TestCase):
+    def setUp(self):
+        self.source_a = DataSource.objects.create(data_source_name="A")
+        self.source_b = DataSource.objects.create(data_source_name="B")
+        self.component_a = ScenarioComponent.objects.create(name="Component A", data_source=self.source_a)
+        self.component_b = ScenarioComponent.objects.create(name="Component B", data_source=self.source_b)
+        self.scenario = ScenarioClass.objects.create(scenario_name="Scenario 1", status="PENDING")
+
+    def test_link_copies_component_data_source(self):
+        link = ScenarioComponentLink.objects.create(scenario=self.scenario, component_id=self.component_b.pk)
+        self.assertEqual(link.data_source_id, self.source_b.pk)
+
+    def test_second_component_with_same_data_source_is_rejected(self):
+        ScenarioComponentLink.objects.create(scenario=self.scenario, component=self.component_a)
+        component = ScenarioComponent.objects.create(name="Component A2", data_source=self.source_a)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ScenarioComponentLink.objects.create(scenario=self.scenario, component=component)
+
+    def test_resave_without_component_change_skips_component_lookup(self):
+        ScenarioComponentLink.objects.create(scenario=self.scenario, component=self.component_a)
+        link = ScenarioComponentLink.objects.get()
+        with self.assertNumQueries(1):
+            link.save()
+
+    def test_component_save_without_data_source_change_skips_link_update(self):
+        component = ScenarioComponent.objects.get(pk=self.component_a.pk)
+        component.last_updated = timezone.now()
+        with self.assertNumQueries(1):
+            component.save()
+
+    def test_component_data_source_change_is_synced_to_links(self):
+        link = ScenarioComponentLink.objects.create(scenario=self.scenario, component=self.component_a)
+        self.component_a.data_source = self.source_b
+        self.component_a.save()
+        link.refresh_from_db()
+        self.assertEqual(link.data_source_id, self.source_b.pk)
 
-# Create your tests here.
+    def test_conflicting_component_data_source_change_is_rejected(self):
+        ScenarioComponentLink.objects.create(scenario=self.scenario, component=self.component_a)
+        ScenarioComponentLink.objects.create(scenario=self.scenario, component=self.component_b)
+        self.component_b.data_source = self.source_a
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            self.component_b.save()
@@ -1,5 +1,15 @@
 import os
 from celery import Celery
+from gevent import monkey
+
+# Пул задаётся только флагом командной строки, чтобы monkey-patch gevent
+# применился до импорта остального кода:
+#   celery -A prodcast_worker worker -P gevent -c 100
+# Под gevent psycopg2 должен отдавать управление на ожидании ответа от PostgreSQL,
+# иначе один запрос блокирует все greenlet'ы процесса.
+if monkey.is_module_patched("socket"):
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
 
 # Указываем настройки Django
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'prodcast_worker.settings')
@@ -10,5 +20,5 @@ app = Celery('prodcast_worker')
 # Подключаем настройки из Django (будет искать CELERY_*)
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
-# Автоматически подхватывать tasks.py из приложений
-app.autodiscover_tasks()
+# Подхватывать tasks.py только из приложений с задачами, без обхода всех INSTALLED_APPS
+app.autodiscover_tasks(['core'])
@@ -132,6 +132,16 @@ CELERY_RESULT_SERIALIZER = "json"
 # Redis в качестве брокера
 CELERY_BROKER_URL='redis://172.17.5.130:6379/0'
 CELERY_RESULT_BACKEND='redis://172.17.5.130:6379/1'
+# Задачи в основном ждут БД/брокер: воркер запускается с gevent-пулом
+# (celery -A prodcast_worker worker -P gevent -c 100), см. celery.py
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BROKER_POOL_LIMIT = 50
+# Запись ScenarioLog — в отдельной очереди со своим воркером:
+#   celery -A prodcast_worker worker -Q logs -c 2
+CELERY_TASK_ROUTES = {
+    "worker.log_batch": {"queue": "logs"},
+}
 
 class DisableMigrations:
     def __contains__(self, item):